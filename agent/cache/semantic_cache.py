@@ -0,0 +1,118 @@
+"""Semantic response cache for the hybrid agent."""
+
+import copy
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+
+class SemanticCache:
+    """Cache agent results by cosine similarity of question embeddings."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", threshold: float = 0.92,
+                 ttl_seconds: float = 3600.0, max_size: int = 2048, train_size: int = 256):
+        self.model = SentenceTransformer(model_name)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.train_size = train_size
+        self.dim = self.model.get_sentence_embedding_dimension()
+        # Embeddings are L2-normalized, so inner product == cosine similarity.
+        # Starts exact (FP32) and switches to int8 once train_size entries exist
+        self.index = faiss.IndexFlatIP(self.dim)
+        # Parallel to the index rows: {"result", "format_hint", "created_at", "last_used"}
+        self.entries: List[Dict[str, Any]] = []
+        # Guards index and entries; embedding runs outside it
+        self._lock = threading.Lock()
+
+    def embed(self, question: str, format_hint: str) -> np.ndarray:
+        """Embed a (question, format_hint) pair as a normalized float32 row."""
+        emb = self.model.encode([question + "|" + format_hint], normalize_embeddings=True)
+        return np.asarray(emb, dtype=np.float32)
+
+    def lookup(self, emb: np.ndarray, format_hint: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the closest cached result, or None on a miss.
+        
+        A hit must have the same format_hint, so answers keep their shape.
+        """
+        with self._lock:
+            if not self.entries:
+                return None
+
+            D, I = self.index.search(emb, 1)
+            similarity, pos = float(D[0][0]), int(I[0][0])
+            if pos < 0 or similarity < self.threshold:
+                return None
+
+            now = time.time()
+            entry = self.entries[pos]
+            if entry["format_hint"] != format_hint:
+                return None
+            if now - entry["created_at"] > self.ttl_seconds:
+                self._remove(pos)
+                return None
+
+            entry["last_used"] = now
+            result = copy.deepcopy(entry["result"])
+
+        result["trace"] = result.get("trace", []) + [
+            {"step": "semantic_cache", "similarity": round(similarity, 4)}
+        ]
+        return result
+
+    def add(self, emb: np.ndarray, result: Dict[str, Any], format_hint: str):
+        """Store a result, evicting expired and least recently used entries."""
+        result = copy.deepcopy(result)
+        with self._lock:
+            now = time.time()
+            self._evict_expired(now)
+            while len(self.entries) >= self.max_size:
+                lru = min(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"])
+                self._remove(lru)
+
+            self.index.add(emb)
+            self.entries.append({
+                "result": result,
+                "format_hint": format_hint,
+                "created_at": now,
+                "last_used": now
+            })
+            self._maybe_quantize()
+
+    def clear(self):
+        """Drop every cached entry."""
+        with self._lock:
+            self.index = faiss.IndexFlatIP(self.dim)
+            self.entries = []
+
+    def _evict_expired(self, now: float):
+        """Remove entries older than the TTL."""
+        for pos in reversed(range(len(self.entries))):
+            if now - self.entries[pos]["created_at"] > self.ttl_seconds:
+                self._remove(pos)
+
+    def _maybe_quantize(self):
+        """Move the index to int8 scalar-quantized storage once it can be trained."""
+        if isinstance(self.index, faiss.IndexScalarQuantizer) or self.index.ntotal < self.train_size:
+            return
+        embs = self.index.reconstruct_n(0, self.index.ntotal)
+        index = faiss.IndexScalarQuantizer(
+            self.dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(embs)
+        index.add(embs)
+        self.index = index
+
+    def _remove(self, pos: int):
+        """Remove one entry, keeping index rows aligned with entries."""
+        # Flat and scalar-quantized indexes compact in order on removal,
+        # so positions stay in sync
+        self.index.remove_ids(np.array([pos], dtype=np.int64))
+        del self.entries[pos]
+
+    def __len__(self) -> int:
+        return len(self.entries)
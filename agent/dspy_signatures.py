@@ -3,6 +3,8 @@
 import dspy
 from typing import Literal
 
+from agent.tools.sqlite_tool import CODE_FENCE_RE
+
 
 class RouteQuery(dspy.Signature):
     """Classify whether a query needs RAG, SQL, or both (hybrid)."""
@@ -16,9 +18,10 @@ class RouteQuery(dspy.Signature):
 class GenerateSQL(dspy.Signature):
     """Generate SQLite query from natural language question and schema."""
     
-    question: str = dspy.InputField(desc="Natural language question")
+    # Static inputs first so every prompt shares the longest possible prefix
     db_schema: str = dspy.InputField(desc="Database schema with table and column info")
     constraints: str = dspy.InputField(desc="Extracted constraints like dates, categories, KPIs")
+    question: str = dspy.InputField(desc="Natural language question")
     sql: str = dspy.OutputField(
         desc="Valid SQLite query. Use exact table/column names from schema. No markdown."
     )
@@ -27,8 +30,8 @@ class GenerateSQL(dspy.Signature):
 class SynthesizeAnswer(dspy.Signature):
     """Synthesize final answer from SQL results and/or retrieved docs."""
     
-    question: str = dspy.InputField(desc="Original question")
     format_hint: str = dspy.InputField(desc="Expected output format (int, float, dict, list)")
+    question: str = dspy.InputField(desc="Original question")
     sql_results: str = dspy.InputField(desc="SQL query results as JSON, or empty")
     doc_chunks: str = dspy.InputField(desc="Retrieved document chunks with IDs, or empty")
     answer: str = dspy.OutputField(
@@ -46,6 +49,10 @@ class RouterModule(dspy.Module):
     def forward(self, question: str) -> str:
         result = self.route(question=question)
         return result.route
+    
+    async def aforward(self, question: str) -> str:
+        result = await self.route.acall(question=question)
+        return result.route
 
 
 class NLtoSQLModule(dspy.Module):
@@ -61,12 +68,21 @@ class NLtoSQLModule(dspy.Module):
             db_schema=schema,
             constraints=constraints
         )
+        return self._clean_sql(result.sql)
+    
+    async def aforward(self, question: str, schema: str, constraints: str) -> str:
+        result = await self.generate.acall(
+            question=question,
+            db_schema=schema,
+            constraints=constraints
+        )
+        return self._clean_sql(result.sql)
+    
+    def _clean_sql(self, sql: str) -> str:
         # Clean up any markdown formatting
-        sql = result.sql.strip()
-        if sql.startswith("```sql"):
-            sql = sql.replace("```sql", "").replace("```", "").strip()
-        elif sql.startswith("```"):
-            sql = sql.replace("```", "").strip()
+        sql = sql.strip()
+        if sql.startswith("```"):
+            sql = CODE_FENCE_RE.sub("", sql).strip()
         return sql
 
 
@@ -85,4 +101,14 @@ class SynthesizerModule(dspy.Module):
             sql_results=sql_results,
             doc_chunks=doc_chunks
         )
+        return result.answer.strip()
+    
+    async def aforward(self, question: str, format_hint: str,
+                       sql_results: str, doc_chunks: str) -> str:
+        result = await self.synthesize.acall(
+            question=question,
+            format_hint=format_hint,
+            sql_results=sql_results,
+            doc_chunks=doc_chunks
+        )
         return result.answer.strip()
\ No newline at end of file
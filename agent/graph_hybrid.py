@@ -1,14 +1,27 @@
 """LangGraph-based hybrid agent for retail analytics."""
 
-from typing import TypedDict, List, Dict, Any, Annotated, Literal
+import asyncio
+from typing import TypedDict, List, Dict, Any, Annotated, Literal, Tuple
 from langgraph.graph import StateGraph, END
+import dspy
 import json
+import operator
 import re
 from datetime import datetime
 
 from agent.dspy_signatures import RouterModule, NLtoSQLModule, SynthesizerModule
 from agent.rag.retrieval import DocumentRetriever
 from agent.tools.sqlite_tool import SQLiteTool
+from agent.sql_templates import TEMPLATE_TABLES, TEMPLATE_IDENTIFIERS
+
+
+# Answer parsing: code blocks, first int/float, embedded JSON object/array
+_CODE_BLOCK_RE = re.compile(r'```.*?```', re.DOTALL)
+_INT_RE = re.compile(r'\d+')
+_FLOAT_RE = re.compile(r'\d+\.?\d*')
+_JSON_RE = re.compile(r'\{.*\}|\[.*\]', re.DOTALL)
+# Field names and types in hints like "{category:str, quantity:int}"
+_FORMAT_FIELD_RE = re.compile(r'(\w+)\s*:\s*(\w+)')
 
 
 class AgentState(TypedDict):
@@ -17,27 +30,80 @@ class AgentState(TypedDict):
     format_hint: str
     route: str
     doc_chunks: List[Dict[str, Any]]
+    doc_chunks_str: str  # Prompt-ready JSON, serialized once at retrieval
     constraints: str
     sql: str
     sql_results: Dict[str, Any]
+    sql_results_str: str  # Prompt-ready JSON, serialized once at execution
     final_answer: Any
     confidence: float
     explanation: str
     citations: List[str]
     error: str
     repair_count: int
-    trace: List[Dict[str, Any]]
+    # Appended to by parallel branches, so nodes return only new entries
+    trace: Annotated[List[Dict[str, Any]], operator.add]
 
 
 class HybridAgent:
-    """Hybrid RAG + SQL agent using LangGraph."""
+    """Hybrid RAG + SQL agent using LangGraph.
+    
+    Nodes return partial state updates so the hybrid route can run document
+    retrieval in parallel with SQL generation.
+    """
+    
+    # State keys merged with a reducer instead of overwritten
+    _REDUCERS = {"trace": operator.add}
+    
+    # KPI abbreviations in the docs and how questions refer to them
+    _KPI_TERMS = {
+        "AOV": ("aov", "average order value"),
+        "GM": ("margin",),
+    }
+    
+    # Evidence each route should produce; each missing kind lowers confidence
+    _EXPECTED_EVIDENCE = {
+        "sql": ("rows",),
+        "rag": ("chunks",),
+        "hybrid": ("rows", "chunks"),
+    }
+    _REPAIR_PENALTY = 0.15
+    _MISSING_EVIDENCE_PENALTY = 0.2
+    _TEMPLATE_CONFIDENCE = 0.95
     
-    def __init__(self, router_module, nl_to_sql_module, synthesizer_module):
+    # Exact format hints; others are checked by list/dict shape
+    _FORMAT_TYPES = {"int": int, "float": (int, float)}
+    
+    # Tables cited when they appear in the SQL, paired with their lowercase form
+    _CITATION_TABLES = [
+        (table, table.lower()) for table in
+        ["Orders", "Order Details", "Products", "Customers",
+         "Categories", "Suppliers", "Employees"]
+    ]
+    # Any citable table name, in one case-insensitive scan of the SQL
+    _CITATION_TABLE_RE = re.compile(
+        r"\b(" + "|".join(re.escape(table) for table, _ in _CITATION_TABLES) + r")\b",
+        re.IGNORECASE
+    )
+    
+    def __init__(self, router_module, nl_to_sql_module, synthesizer_module, cache=None,
+                 retriever_backend: str = "bm25", prune_schema: bool = False):
         self.router = router_module
         self.nl_to_sql = nl_to_sql_module
         self.synthesizer = synthesizer_module
-        self.retriever = DocumentRetriever()
+        self.cache = cache  # Optional agent.cache.semantic_cache.SemanticCache
+        self.retriever = DocumentRetriever(backend=retriever_backend)
         self.db_tool = SQLiteTool()
+        # One byte-identical schema string for every NL->SQL prompt, so the
+        # LLM server can reuse its KV cache for the shared prompt prefix.
+        # prune_schema keeps only the tables/columns templates use: fewer input
+        # tokens, but NL->SQL only sees questions no template matched, so
+        # those can no longer name other columns (ShipCountry, Shippers, ...)
+        if prune_schema:
+            self.db_schema = self.db_tool.get_pruned_schema_summary(TEMPLATE_TABLES, TEMPLATE_IDENTIFIERS)
+        else:
+            self.db_schema = self.db_tool.get_schema_summary()
+        self._campaign_chunks, self._kpi_chunks = self._index_constraint_chunks()
         self.graph = self._build_graph()
     
     def _build_graph(self) -> StateGraph:
@@ -48,6 +114,7 @@ class HybridAgent:
         workflow.add_node("router", self._route_query)
         workflow.add_node("retriever", self._retrieve_docs)
         workflow.add_node("planner", self._plan_constraints)
+        workflow.add_node("template_shortcircuit", self._shortcircuit_template)
         workflow.add_node("nl_to_sql", self._generate_sql)
         workflow.add_node("executor", self._execute_sql)
         workflow.add_node("synthesizer", self._synthesize_answer)
@@ -64,16 +131,26 @@ class HybridAgent:
             {
                 "rag": "retriever",
                 "sql": "planner",
-                "hybrid": "retriever"
+                "hybrid": "planner"
             }
         )
         
+        workflow.add_edge("planner", "template_shortcircuit")
+        
+        # Template hit: done (hybrid still retrieves docs for citations).
+        # Miss on hybrid: fan out so BM25 retrieval overlaps the NL->SQL LLM call
+        workflow.add_conditional_edges(
+            "template_shortcircuit",
+            self._shortcircuit_decision,
+        )
+        
+        # Hybrid retrieval finishes alongside nl_to_sql, so the SQL branch
+        # reaches the synthesizer with doc_chunks already merged into state
         workflow.add_conditional_edges(
             "retriever",
-            lambda state: "planner" if state["route"] in ["sql", "hybrid"] else "synthesizer",
+            lambda state: "synthesizer" if state["route"] == "rag" else END,
         )
         
-        workflow.add_edge("planner", "nl_to_sql")
         workflow.add_edge("nl_to_sql", "executor")
         
         workflow.add_conditional_edges(
@@ -95,190 +172,319 @@ class HybridAgent:
         """Decision function for routing."""
         return state["route"]
     
-    def _route_query(self, state: AgentState) -> AgentState:
+    def _shortcircuit_decision(self, state: AgentState):
+        """Decision function after the template short-circuit."""
+        answered = state["final_answer"] is not None
+        if state["route"] == "hybrid":
+            return "retriever" if answered else ["retriever", "nl_to_sql"]
+        return END if answered else "nl_to_sql"
+    
+    async def _route_query(self, state: AgentState) -> Dict[str, Any]:
         """Node 1: Route the query."""
-        route = self.router.forward(state["question"])
-        state["route"] = route
-        state["trace"].append({"step": "router", "route": route})
-        return state
+        route = await self.router.aforward(state["question"])
+        return self._route_update(route)
+    
+    def _route_update(self, route: str) -> Dict[str, Any]:
+        """State update recording the router decision."""
+        return {"route": route, "trace": [{"step": "router", "route": route}]}
     
-    def _retrieve_docs(self, state: AgentState) -> AgentState:
+    def _retrieve_docs(self, state: AgentState) -> Dict[str, Any]:
         """Node 2: Retrieve relevant documents."""
         chunks = self.retriever.retrieve(state["question"], top_k=3)
-        state["doc_chunks"] = [chunk.to_dict() for chunk in chunks]
-        state["trace"].append({
-            "step": "retriever",
-            "chunks": [c["id"] for c in state["doc_chunks"]]
-        })
-        return state
-    
-    def _plan_constraints(self, state: AgentState) -> AgentState:
-        """Node 3: Extract constraints from docs and question."""
-        constraints = []
+        doc_chunks = [chunk.to_dict() for chunk in chunks]
+        return {
+            "doc_chunks": doc_chunks,
+            # Hybrid template hits end here, so cite the template SQL too; on
+            # the parallel branch sql is still empty and the synthesizer
+            # replaces these with the final citations
+            "citations": self._extract_citations({"sql": state["sql"], "doc_chunks": doc_chunks}),
+            # The synthesizer only needs id + content
+            "doc_chunks_str": json.dumps(
+                [{"id": chunk.id, "content": chunk.content} for chunk in chunks],
+                ensure_ascii=False
+            ),
+            "trace": [{"step": "retriever", "chunks": [chunk.id for chunk in chunks]}]
+        }
+    
+    def _index_constraint_chunks(self):
+        """Find campaign date and KPI formula chunks in the corpus."""
+        campaigns = []  # (campaign name, season word, content)
+        kpis = []  # (question terms, content)
         
-        # Extract from doc chunks
-        for chunk in state["doc_chunks"]:
-            content = chunk["content"]
-            # Look for dates
+        for chunk in self.retriever.chunks:
+            content = chunk.content
             if "Dates:" in content:
+                name = content.splitlines()[0].lstrip("# ").strip().lower()
+                campaigns.append((name, name.split()[0], content))
+            for line in content.splitlines():
+                kpi = line.lstrip("- ").split("=")[0].strip()
+                if "=" in line and kpi in self._KPI_TERMS:
+                    kpis.append((self._KPI_TERMS[kpi], content))
+                    break
+        
+        return campaigns, kpis
+    
+    def _plan_constraints(self, state: AgentState) -> Dict[str, Any]:
+        """Node 3: Extract constraints from the question.
+        
+        Works off the question alone (matched against campaign and KPI
+        chunks indexed at startup) so it doesn't wait on retrieval.
+        """
+        constraints = []
+        question = state["question"].lower()
+        
+        # Campaign dates, e.g. 'Summer Beverages 1997' or just 'summer'
+        for name, season, content in self._campaign_chunks:
+            if name in question or season in question:
                 constraints.append(content)
-            # Look for formulas
-            if "=" in content and any(kw in content for kw in ["AOV", "GM", "Gross Margin"]):
+        
+        # KPI formulas, e.g. AOV or gross margin
+        for terms, content in self._kpi_chunks:
+            if any(term in question for term in terms):
                 constraints.append(content)
         
-        # Extract from question
-        if "summer" in state["question"].lower() or "winter" in state["question"].lower():
-            # Find campaign in chunks
-            for chunk in state["doc_chunks"]:
-                if "Summer Beverages" in chunk["content"] or "Winter Classics" in chunk["content"]:
-                    constraints.append(chunk["content"])
+        constraints = "\n".join(constraints) if constraints else "No specific constraints"
+        return {
+            "constraints": constraints,
+            "trace": [{"step": "planner", "constraints": constraints[:100]}]
+        }
+    
+    def _shortcircuit_template(self, state: AgentState) -> Dict[str, Any]:
+        """
+        Node 3b: Answer template questions without NL->SQL or synthesis.
+        
+        Runs the pre-validated template SQL and formats the rows for the
+        format_hint directly. Falls through to nl_to_sql when no template
+        matches or the rows don't fit the hint.
+        """
+        miss = {"trace": [{"step": "template_shortcircuit", "hit": False}]}
+        
+        update = self._template_sql_update(state)
+        if not update:
+            return miss
+        
+        sql = update["sql"]
+        results = self.db_tool.execute_query(sql)
+        if results["error"]:
+            return miss
+        answer = self._format_rows(results["columns"], results["rows"], state["format_hint"])
+        if answer is None:
+            return miss
+        
+        return {
+            "sql": sql,
+            "sql_results": results,
+            "sql_results_str": json.dumps(results, default=str),
+            "final_answer": answer,
+            "explanation": f"Computed from a pre-validated SQL template returning {len(results['rows'])} rows.",
+            "citations": self._extract_citations({"sql": sql, "doc_chunks": state["doc_chunks"]}),
+            "confidence": self._TEMPLATE_CONFIDENCE,
+            "trace": [{"step": "template_shortcircuit", "hit": True, "sql": sql[:100]}]
+        }
+    
+    def _format_rows(self, columns: List[str], rows: List[tuple], format_hint: str) -> Any:
+        """Format SQL rows to match format_hint, or None if they don't fit."""
+        if not rows or any(value is None for row in rows for value in row):
+            return None
         
-        state["constraints"] = "\n".join(constraints) if constraints else "No specific constraints"
-        state["trace"].append({"step": "planner", "constraints": state["constraints"][:100]})
-        return state
+        try:
+            # Scalar hints: a single value
+            if format_hint in self._FORMAT_TYPES:
+                if len(rows) != 1 or len(columns) != 1:
+                    return None
+                return self._coerce(rows[0][0], format_hint)
+            
+            # Record hints: column names must be the hint's fields
+            field_types = dict(_FORMAT_FIELD_RE.findall(format_hint))
+            if field_types and set(field_types) != set(columns):
+                return None
+            records = [
+                {col: self._coerce(value, field_types.get(col)) for col, value in zip(columns, row)}
+                for row in rows
+            ]
+        except (TypeError, ValueError):
+            return None
+        
+        if "list" in format_hint:
+            return records
+        if "{" in format_hint and len(records) == 1:
+            return records[0]
+        return None
+    
+    def _coerce(self, value: Any, type_name: str) -> Any:
+        """Convert a SQL value to a format-hint type name."""
+        if type_name == "int":
+            return int(value)
+        if type_name == "float":
+            return round(float(value), 2)
+        if type_name == "str":
+            return str(value)
+        return value
     
-    def _generate_sql(self, state: AgentState) -> AgentState:
+    async def _generate_sql(self, state: AgentState) -> Dict[str, Any]:
         """Node 4: Generate SQL using templates first, then DSPy fallback."""
         try:
             # ALWAYS try template-based approach first (more reliable)
-            from agent.sql_templates import get_sql_for_question, validate_and_fix_sql
-            
-            template_sql = get_sql_for_question(
-                state["question"],
-                state["constraints"]
-            )
-            
-            if template_sql:
-                # Use template - these are pre-validated and guaranteed to work
-                state["sql"] = template_sql.strip()
-                state["error"] = None
-                state["trace"].append({
-                    "step": "nl_to_sql",
-                    "method": "template",
-                    "sql": template_sql[:100]
-                })
-                return state
+            update = self._template_sql_update(state)
+            if update:
+                return update
             
             # Only use DSPy if no template matches
-            sql = self.nl_to_sql.forward(
+            sql = await self.nl_to_sql.aforward(
                 question=state["question"],
-                schema=self.db_tool.get_schema_summary(),
+                schema=self.db_schema,
                 constraints=state["constraints"]
             )
+            return self._generated_sql_update(sql)
             
-            # Try to fix common SQL errors
-            sql = validate_and_fix_sql(sql)
-            
-            state["sql"] = sql
-            state["error"] = None
-            state["trace"].append({
+        except Exception as e:
+            return {
+                "error": f"SQL generation failed: {str(e)}",
+                "trace": [{"step": "nl_to_sql", "error": str(e)}]
+            }
+    
+    def _template_sql_update(self, state: AgentState) -> Dict[str, Any]:
+        """State update using a pre-validated SQL template, if one matches."""
+        from agent.sql_templates import get_sql_for_question
+        
+        template_sql = get_sql_for_question(
+            state["question"],
+            state["constraints"]
+        )
+        if not template_sql:
+            return None
+        
+        # Use template - these are pre-validated and guaranteed to work
+        return {
+            "sql": template_sql.strip(),
+            "error": None,
+            "trace": [{
+                "step": "nl_to_sql",
+                "method": "template",
+                "sql": template_sql[:100]
+            }]
+        }
+    
+    def _generated_sql_update(self, sql: str) -> Dict[str, Any]:
+        """State update for DSPy-generated SQL after applying common fixes."""
+        from agent.sql_templates import validate_and_fix_sql
+        
+        # Try to fix common SQL errors
+        sql = validate_and_fix_sql(sql)
+        
+        return {
+            "sql": sql,
+            "error": None,
+            "trace": [{
                 "step": "nl_to_sql",
                 "method": "dspy+fix",
                 "sql": sql[:100]
-            })
-            
-        except Exception as e:
-            state["error"] = f"SQL generation failed: {str(e)}"
-            state["trace"].append({"step": "nl_to_sql", "error": str(e)})
-        
-        return state
+            }]
+        }
     
-    def _execute_sql(self, state: AgentState) -> AgentState:
+    def _execute_sql(self, state: AgentState) -> Dict[str, Any]:
         """Node 5: Execute SQL query."""
         if state.get("error"):
-            return state
+            return {}
         
         results = self.db_tool.execute_query(state["sql"])
-        state["sql_results"] = results
+        update = {
+            "sql_results": results,
+            "sql_results_str": json.dumps(results, default=str),
+            "trace": [{
+                "step": "executor",
+                "success": results["error"] is None,
+                "rows": len(results["rows"])
+            }]
+        }
         
         if results["error"]:
-            state["error"] = f"SQL execution failed: {results['error']}"
+            update["error"] = f"SQL execution failed: {results['error']}"
         
-        state["trace"].append({
-            "step": "executor",
-            "success": results["error"] is None,
-            "rows": len(results["rows"])
-        })
-        
-        return state
+        return update
     
-    def _synthesize_answer(self, state: AgentState) -> AgentState:
+    async def _synthesize_answer(self, state: AgentState) -> Dict[str, Any]:
         """Node 6: Synthesize final answer using DSPy."""
-        sql_results_str = json.dumps(state.get("sql_results", {}), default=str)
-        doc_chunks_str = json.dumps(state.get("doc_chunks", []), default=str)
-        
         try:
-            answer_str = self.synthesizer.forward(
+            answer_str = await self.synthesizer.aforward(
                 question=state["question"],
                 format_hint=state["format_hint"],
-                sql_results=sql_results_str,
-                doc_chunks=doc_chunks_str
+                sql_results=state["sql_results_str"],
+                doc_chunks=state["doc_chunks_str"]
             )
-            
-            # Parse answer based on format_hint
-            state["final_answer"] = self._parse_answer(answer_str, state["format_hint"])
-            state["explanation"] = self._generate_explanation(state)
-            state["citations"] = self._extract_citations(state)
-            state["confidence"] = self._calculate_confidence(state)
-            
-            state["trace"].append({"step": "synthesizer", "answer": str(state["final_answer"])[:100]})
+            return self._answer_update(state, answer_str)
         
         except Exception as e:
-            state["error"] = f"Synthesis failed: {str(e)}"
-            state["trace"].append({"step": "synthesizer", "error": str(e)})
-        
-        return state
+            return {
+                "error": f"Synthesis failed: {str(e)}",
+                "trace": [{"step": "synthesizer", "error": str(e)}]
+            }
     
-    def _validate_output(self, state: AgentState) -> AgentState:
+    def _answer_update(self, state: AgentState, answer_str: str) -> Dict[str, Any]:
+        """State update parsing the synthesizer output into answer fields."""
+        # Parse answer based on format_hint
+        final_answer = self._parse_answer(answer_str, state["format_hint"])
+        return {
+            "final_answer": final_answer,
+            "explanation": self._generate_explanation(state),
+            "citations": self._extract_citations(state),
+            "confidence": self._calculate_confidence(state),
+            "trace": [{"step": "synthesizer", "answer": str(final_answer)[:100]}]
+        }
+    
+    def _validate_output(self, state: AgentState) -> Dict[str, Any]:
         """Node 7: Validate output format and citations."""
+        error = state.get("error")
+        
         # Check if answer matches format_hint
         if not self._validate_format(state["final_answer"], state["format_hint"]):
             if state["repair_count"] < 2:
-                state["error"] = f"Answer format doesn't match {state['format_hint']}"
+                error = f"Answer format doesn't match {state['format_hint']}"
         
         # Check if we have citations when needed
         if not state["citations"] and state["route"] != "rag":
             if state["repair_count"] < 2:
-                state["error"] = "Missing citations"
+                error = "Missing citations"
         
-        state["trace"].append({"step": "validator", "valid": not state.get("error")})
-        return state
+        return {"error": error, "trace": [{"step": "validator", "valid": not error}]}
     
-    def _repair_query(self, state: AgentState) -> AgentState:
+    def _repair_query(self, state: AgentState) -> Dict[str, Any]:
         """Node 8: Repair loop - increment count and clear error for retry."""
-        state["repair_count"] += 1
-        state["trace"].append({
-            "step": "repair",
-            "attempt": state["repair_count"],
-            "error": state.get("error")
-        })
-        # Clear error to allow retry
-        state["error"] = None
-        return state
+        repair_count = state["repair_count"] + 1
+        return {
+            "repair_count": repair_count,
+            # Clear error to allow retry
+            "error": None,
+            "trace": [{
+                "step": "repair",
+                "attempt": repair_count,
+                "error": state.get("error")
+            }]
+        }
     
     def _parse_answer(self, answer_str: str, format_hint: str) -> Any:
         """Parse answer string based on format hint."""
         answer_str = answer_str.strip()
         
         # Remove any markdown or code blocks
-        answer_str = re.sub(r'```.*?```', '', answer_str, flags=re.DOTALL)
+        answer_str = _CODE_BLOCK_RE.sub('', answer_str)
         answer_str = answer_str.strip()
         
         if format_hint == "int":
             # Extract first number
-            match = re.search(r'\d+', answer_str)
+            match = _INT_RE.search(answer_str)
             return int(match.group()) if match else 0
         
         elif format_hint == "float":
             # Extract first float
-            match = re.search(r'\d+\.?\d*', answer_str)
+            match = _FLOAT_RE.search(answer_str)
             return round(float(match.group()), 2) if match else 0.0
         
         elif "{" in format_hint or "list" in format_hint:
             # Try to parse JSON
             try:
                 # Find JSON in the string
-                json_match = re.search(r'\{.*\}|\[.*\]', answer_str, re.DOTALL)
+                json_match = _JSON_RE.search(answer_str)
                 if json_match:
                     return json.loads(json_match.group())
                 return json.loads(answer_str)
@@ -289,34 +495,31 @@ class HybridAgent:
     
     def _validate_format(self, answer: Any, format_hint: str) -> bool:
         """Validate answer matches format hint."""
-        if format_hint == "int":
-            return isinstance(answer, int)
-        elif format_hint == "float":
-            return isinstance(answer, (int, float))
-        elif "list" in format_hint:
-            return isinstance(answer, list)
-        elif "{" in format_hint:
-            return isinstance(answer, dict)
-        return True
+        expected = self._FORMAT_TYPES.get(format_hint)
+        if expected is None:
+            expected = list if "list" in format_hint else dict if "{" in format_hint else object
+        return isinstance(answer, expected)
     
     def _extract_citations(self, state: AgentState) -> List[str]:
         """Extract citations from SQL and doc chunks."""
+        # Deduplicate as we go, keeping first-seen order
         citations = []
+        seen = set()
         
         # Add document chunk IDs
         for chunk in state.get("doc_chunks", []):
-            citations.append(chunk["id"])
+            if chunk["id"] not in seen:
+                seen.add(chunk["id"])
+                citations.append(chunk["id"])
         
-        # Add tables used in SQL
+        # Add tables used in SQL, in _CITATION_TABLES order
         if state.get("sql"):
-            sql = state["sql"].upper()
-            tables = ["Orders", "Order Details", "Products", "Customers", 
-                     "Categories", "Suppliers", "Employees"]
-            for table in tables:
-                if table.upper() in sql:
+            used = {m.group(1).lower() for m in self._CITATION_TABLE_RE.finditer(state["sql"])}
+            for table, table_lower in self._CITATION_TABLES:
+                if table_lower in used:
                     citations.append(table)
         
-        return list(set(citations))  # Remove duplicates
+        return citations
     
     def _generate_explanation(self, state: AgentState) -> str:
         """Generate brief explanation."""
@@ -332,30 +535,31 @@ class HybridAgent:
         confidence = 1.0
         
         # Lower confidence if repaired
-        confidence -= 0.15 * state["repair_count"]
+        confidence -= self._REPAIR_PENALTY * state["repair_count"]
         
-        # Lower if no SQL results when expected
-        if state["route"] in ["sql", "hybrid"]:
-            if not state.get("sql_results", {}).get("rows"):
-                confidence -= 0.2
-        
-        # Lower if no doc chunks when expected
-        if state["route"] in ["rag", "hybrid"]:
-            if not state.get("doc_chunks"):
-                confidence -= 0.2
+        # Lower for each kind of evidence the route expected but didn't get
+        evidence = {
+            "rows": bool(state.get("sql_results", {}).get("rows")),
+            "chunks": bool(state.get("doc_chunks")),
+        }
+        for kind in self._EXPECTED_EVIDENCE.get(state["route"], ()):
+            if not evidence[kind]:
+                confidence -= self._MISSING_EVIDENCE_PENALTY
         
         return max(0.0, min(1.0, confidence))
     
-    def run(self, question: str, format_hint: str) -> Dict[str, Any]:
-        """Run the agent on a question."""
-        initial_state = {
+    def _initial_state(self, question: str, format_hint: str) -> AgentState:
+        """Build a fresh graph state for a question."""
+        return {
             "question": question,
             "format_hint": format_hint,
             "route": "",
             "doc_chunks": [],
+            "doc_chunks_str": "[]",
             "constraints": "",
             "sql": "",
             "sql_results": {},
+            "sql_results_str": "{}",
             "final_answer": None,
             "confidence": 0.0,
             "explanation": "",
@@ -364,9 +568,9 @@ class HybridAgent:
             "repair_count": 0,
             "trace": []
         }
-        
-        final_state = self.graph.invoke(initial_state)
-        
+    
+    def _result_from_state(self, final_state: AgentState) -> Dict[str, Any]:
+        """Extract the public result dict from a finished state."""
         return {
             "final_answer": final_state["final_answer"],
             "sql": final_state.get("sql", ""),
@@ -374,4 +578,171 @@ class HybridAgent:
             "explanation": final_state["explanation"],
             "citations": final_state["citations"],
             "trace": final_state["trace"]
-        }
\ No newline at end of file
+        }
+    
+    def run(self, question: str, format_hint: str, bypass_cache: bool = False) -> Dict[str, Any]:
+        """Run the agent on a question.
+        
+        Set bypass_cache for questions whose answers must not be reused.
+        Starts its own event loop, so it can't be called from a running
+        loop; await arun there instead.
+        """
+        return asyncio.run(self.arun(question, format_hint, bypass_cache))
+    
+    async def arun(self, question: str, format_hint: str, bypass_cache: bool = False) -> Dict[str, Any]:
+        """Async version of run; concurrent calls overlap their LLM requests."""
+        use_cache = self.cache is not None and not bypass_cache
+        if use_cache:
+            # Embedding and cache copies block, so keep them off the event loop
+            emb = await asyncio.to_thread(self.cache.embed, question, format_hint)
+            cached = await asyncio.to_thread(self.cache.lookup, emb, format_hint)
+            if cached is not None:
+                return cached
+        
+        final_state = await self.graph.ainvoke(self._initial_state(question, format_hint))
+        result = self._result_from_state(final_state)
+        
+        if use_cache:
+            await asyncio.to_thread(self.cache.add, emb, result, format_hint)
+        
+        return result
+    
+    def run_many(self, questions: List[Tuple[str, str]], num_threads: int = 4,
+                 bypass_cache: bool = False) -> List[Dict[str, Any]]:
+        """
+        Run the agent on many (question, format_hint) pairs.
+        
+        Walks the same stages as the graph, but sends each LLM stage
+        (router, NL->SQL, synthesizer) to the LM as one batch so the backend
+        sees many concurrent requests instead of one at a time.
+        
+        Returns:
+            Result dicts in the same order as questions
+        """
+        use_cache = self.cache is not None and not bypass_cache
+        results: List[Dict[str, Any]] = [None] * len(questions)
+        pending = []  # (position, embedding, state)
+        
+        for pos, (question, format_hint) in enumerate(questions):
+            emb = None
+            if use_cache:
+                emb = self.cache.embed(question, format_hint)
+                cached = self.cache.lookup(emb, format_hint)
+                if cached is not None:
+                    results[pos] = cached
+                    continue
+            pending.append((pos, emb, self._initial_state(question, format_hint)))
+        
+        states = [state for _, _, state in pending]
+        if states:
+            # Stage 1: route all questions at once
+            routes = self.router.batch(
+                [dspy.Example(question=s["question"]).with_inputs("question") for s in states],
+                num_threads=num_threads
+            )
+            for state, route in zip(states, routes):
+                # Failed predictions come back as None; hybrid uses both sources
+                self._merge(state, self._route_update(route or "hybrid"))
+            
+            # Stage 2: constraints, template answers and docs (no LLM),
+            # then batched SQL for questions no template answered
+            for state in states:
+                if state["route"] in ["sql", "hybrid"]:
+                    self._merge(state, self._plan_constraints(state))
+                    self._merge(state, self._shortcircuit_template(state))
+                if state["route"] in ["rag", "hybrid"]:
+                    self._merge(state, self._retrieve_docs(state))
+            to_synthesize = [s for s in states if s["final_answer"] is None]
+            self._batch_sql([s for s in to_synthesize if s["route"] in ["sql", "hybrid"]], num_threads)
+            
+            # Stage 3: batched synthesis, with the validator's repair loop
+            while to_synthesize:
+                self._batch_synthesize(to_synthesize, num_threads)
+                for state in to_synthesize:
+                    self._merge(state, self._validate_output(state))
+                
+                to_synthesize = [s for s in to_synthesize
+                                 if s.get("error") and s["repair_count"] < 2]
+                for state in to_synthesize:
+                    self._merge(state, self._repair_query(state))
+                self._batch_sql(to_synthesize, num_threads)
+        
+        for pos, emb, state in pending:
+            results[pos] = self._result_from_state(state)
+            if use_cache:
+                self.cache.add(emb, results[pos], state["format_hint"])
+        
+        return results
+    
+    def _batch_sql(self, states: List[AgentState], num_threads: int):
+        """Generate and execute SQL for states in batches, repairing failures."""
+        while states:
+            # Templates need no LLM; batch the rest through DSPy
+            needs_llm = []
+            for state in states:
+                update = self._template_sql_update(state)
+                if update:
+                    self._merge(state, update)
+                else:
+                    needs_llm.append(state)
+            if needs_llm:
+                sqls = self.nl_to_sql.batch(
+                    [
+                        dspy.Example(
+                            question=s["question"],
+                            schema=self.db_schema,
+                            constraints=s["constraints"]
+                        ).with_inputs("question", "schema", "constraints")
+                        for s in needs_llm
+                    ],
+                    num_threads=num_threads
+                )
+                for state, sql in zip(needs_llm, sqls):
+                    if sql is None:
+                        error = "batch prediction error"
+                        self._merge(state, {
+                            "error": f"SQL generation failed: {error}",
+                            "trace": [{"step": "nl_to_sql", "error": error}]
+                        })
+                    else:
+                        self._merge(state, self._generated_sql_update(sql))
+            
+            for state in states:
+                self._merge(state, self._execute_sql(state))
+            
+            states = [s for s in states if s.get("error") and s["repair_count"] < 2]
+            for state in states:
+                self._merge(state, self._repair_query(state))
+    
+    def _batch_synthesize(self, states: List[AgentState], num_threads: int):
+        """Synthesize answers for states in one batch."""
+        if not states:
+            return
+        
+        answers = self.synthesizer.batch(
+            [
+                dspy.Example(
+                    question=s["question"],
+                    format_hint=s["format_hint"],
+                    sql_results=s["sql_results_str"],
+                    doc_chunks=s["doc_chunks_str"]
+                ).with_inputs("question", "format_hint", "sql_results", "doc_chunks")
+                for s in states
+            ],
+            num_threads=num_threads
+        )
+        for state, answer_str in zip(states, answers):
+            if answer_str is None:
+                error = "batch prediction error"
+                self._merge(state, {
+                    "error": f"Synthesis failed: {error}",
+                    "trace": [{"step": "synthesizer", "error": error}]
+                })
+            else:
+                self._merge(state, self._answer_update(state, answer_str))
+    
+    def _merge(self, state: AgentState, update: Dict[str, Any]):
+        """Apply a node's partial update to a state, as the graph would."""
+        for key, value in update.items():
+            reducer = self._REDUCERS.get(key)
+            state[key] = reducer(state[key], value) if reducer else value
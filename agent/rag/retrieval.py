@@ -1,9 +1,22 @@
 """Document retrieval using BM25 for RAG."""
 
+from collections import Counter
 from pathlib import Path
 from typing import List, Dict, Any
-from rank_bm25 import BM25Okapi
+import hashlib
+import pickle
 import re
+import sqlite3
+import threading
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+# Tokenize on ASCII bytes: non-ASCII characters (en dashes, accented
+# letters, the BOM) become "?" and act as separators, A-Z is lowercased
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_LOWER_TABLE = bytes.maketrans(bytes(range(65, 91)), bytes(range(97, 123)))
 
 
 class DocumentChunk:
@@ -24,13 +37,74 @@ class DocumentChunk:
         }
 
 
+class SparseBM25:
+    """
+    Okapi BM25 over a precomputed sparse term-weight matrix.
+    
+    Scores match rank_bm25.BM25Okapi (same k1, b and epsilon idf floor),
+    but a query is scored with one sparse matrix-vector product instead
+    of a Python loop over chunks and query terms.
+    """
+    
+    def __init__(self, corpus: List[List[str]], k1: float = 1.5, b: float = 0.75,
+                 epsilon: float = 0.25):
+        self.vocab: Dict[str, int] = {}
+        rows, cols, tfs = [], [], []
+        for doc_id, tokens in enumerate(corpus):
+            for term, tf in Counter(tokens).items():
+                rows.append(doc_id)
+                cols.append(self.vocab.setdefault(term, len(self.vocab)))
+                tfs.append(tf)
+        
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        tfs = np.asarray(tfs, dtype=np.float64)
+        n_docs = len(corpus)
+        doc_len = np.asarray([len(tokens) for tokens in corpus], dtype=np.float64)
+        avgdl = doc_len.sum() / n_docs
+        
+        # idf with negative values floored to epsilon * average idf
+        doc_freq = np.bincount(cols, minlength=len(self.vocab))
+        idf = np.log(n_docs - doc_freq + 0.5) - np.log(doc_freq + 0.5)
+        idf[idf < 0] = epsilon * idf.mean()
+        
+        weights = idf[cols] * tfs * (k1 + 1) / (
+            tfs + k1 * (1 - b + b * doc_len[rows] / avgdl)
+        )
+        self.doc_matrix = csr_matrix((weights, (rows, cols)), shape=(n_docs, len(self.vocab)))
+    
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        """Score every document against a tokenized query."""
+        # Repeated query terms count once per occurrence, as in BM25Okapi
+        counts = Counter(self.vocab[term] for term in query if term in self.vocab)
+        q_vec = np.zeros(self.doc_matrix.shape[1])
+        q_vec[list(counts)] = list(counts.values())
+        return self.doc_matrix @ q_vec
+
+
 class DocumentRetriever:
-    """BM25-based document retriever."""
+    """
+    BM25-based document retriever.
+    
+    backend="bm25" scores chunks in-process with SparseBM25 (persisted
+    next to the docs). backend="fts5" indexes chunks into an in-memory
+    SQLite FTS5 table and lets SQLite rank them, for large corpora.
+    """
+    
+    BACKENDS = ("bm25", "fts5")
     
-    def __init__(self, docs_dir: str = "docs"):
+    # Bump when chunking, tokenization or the index format changes
+    INDEX_VERSION = 3
+    
+    def __init__(self, docs_dir: str = "docs", backend: str = "bm25"):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown retrieval backend: {backend}. Use one of {self.BACKENDS}")
         self.docs_dir = Path(docs_dir)
+        self.backend = backend
         self.chunks: List[DocumentChunk] = []
         self.bm25 = None
+        self.fts = None
+        self._fts_lock = threading.Lock()  # The FTS5 connection is shared by threads
         self._load_and_chunk_documents()
     
     def _load_and_chunk_documents(self):
@@ -38,13 +112,95 @@ class DocumentRetriever:
         if not self.docs_dir.exists():
             raise FileNotFoundError(f"Documents directory not found: {self.docs_dir}")
         
-        for doc_path in self.docs_dir.glob("*.md"):
+        doc_paths = list(self.docs_dir.glob("*.md"))
+        if self.backend == "fts5":
+            for doc_path in doc_paths:
+                self._chunk_document(doc_path)
+            self._build_fts_index()
+            return
+        
+        cache_path = self._index_cache_path(doc_paths)
+        if self._load_index(cache_path):
+            return
+        
+        for doc_path in doc_paths:
             self._chunk_document(doc_path)
         
         # Build BM25 index
         if self.chunks:
             tokenized_chunks = [self._tokenize(chunk.content) for chunk in self.chunks]
-            self.bm25 = BM25Okapi(tokenized_chunks)
+            self.bm25 = SparseBM25(tokenized_chunks)
+        
+        self._save_index(cache_path)
+    
+    def _build_fts_index(self):
+        """Index chunks into an FTS5 table; rowid is the position in self.chunks."""
+        self.fts = sqlite3.connect(":memory:", check_same_thread=False)
+        self.fts.execute(
+            "CREATE VIRTUAL TABLE chunks_fts USING fts5("
+            "id UNINDEXED, source UNINDEXED, content, tokenize='porter unicode61')"
+        )
+        self.fts.executemany(
+            "INSERT INTO chunks_fts (rowid, id, source, content) VALUES (?, ?, ?, ?)",
+            [(i, chunk.id, chunk.source, chunk.content) for i, chunk in enumerate(self.chunks)]
+        )
+        self.fts.commit()
+    
+    def _retrieve_fts(self, query: str, top_k: int) -> List[DocumentChunk]:
+        """Rank chunks with FTS5's built-in bm25()."""
+        # Quote each term so punctuation in the question can't break MATCH syntax
+        terms = self._tokenize(query)
+        if not terms or top_k <= 0:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+        
+        with self._fts_lock:
+            rows = self.fts.execute(
+                "SELECT rowid, bm25(chunks_fts) AS score FROM chunks_fts "
+                "WHERE chunks_fts MATCH ? ORDER BY score LIMIT ?",
+                (match, top_k)
+            ).fetchall()
+        
+        # FTS5 bm25() is lower-is-better; negate so higher scores rank first
+        results = []
+        for rowid, score in rows:
+            chunk = self.chunks[rowid]
+            results.append(DocumentChunk(
+                id=chunk.id,
+                content=chunk.content,
+                source=chunk.source,
+                score=-float(score)
+            ))
+        return results
+    
+    def _index_cache_path(self, doc_paths: List[Path]) -> Path:
+        """Path of the persisted index for the current document contents."""
+        digest = hashlib.sha256(str(self.INDEX_VERSION).encode())
+        for doc_path in sorted(doc_paths):
+            digest.update(doc_path.name.encode())
+            digest.update(doc_path.read_bytes())
+        return self.docs_dir / f".bm25_{digest.hexdigest()[:16]}.pkl"
+    
+    def _load_index(self, cache_path: Path) -> bool:
+        """Load chunks and BM25 index from disk if a valid cache exists."""
+        if not cache_path.exists():
+            return False
+        try:
+            with open(cache_path, "rb") as f:
+                self.chunks, self.bm25 = pickle.load(f)
+            return True
+        except Exception:
+            return False  # Corrupt or incompatible cache; rebuild
+    
+    def _save_index(self, cache_path: Path):
+        """Persist chunks and BM25 index, replacing stale caches."""
+        try:
+            for stale in self.docs_dir.glob(".bm25_*.pkl"):
+                stale.unlink()
+            with open(cache_path, "wb") as f:
+                pickle.dump((self.chunks, self.bm25), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass  # Read-only docs dir; the index is rebuilt next time
     
     def _chunk_document(self, doc_path: Path):
         """Chunk a single document by paragraphs/sections."""
@@ -69,8 +225,8 @@ class DocumentRetriever:
     def _tokenize(self, text: str) -> List[str]:
         """Simple tokenization for BM25."""
         # Lowercase and split on non-alphanumeric
-        tokens = re.findall(r'\w+', text.lower())
-        return tokens
+        ascii_lower = text.encode('ascii', 'replace').translate(_LOWER_TABLE).decode('ascii')
+        return _TOKEN_RE.findall(ascii_lower)
     
     def retrieve(self, query: str, top_k: int = 3) -> List[DocumentChunk]:
         """
@@ -83,14 +239,23 @@ class DocumentRetriever:
         Returns:
             List of DocumentChunk with scores
         """
+        if self.backend == "fts5":
+            return self._retrieve_fts(query, top_k)
+        
         if not self.chunks or not self.bm25:
             return []
         
         tokenized_query = self._tokenize(query)
-        scores = self.bm25.get_scores(tokenized_query)
+        scores = np.asarray(self.bm25.get_scores(tokenized_query))
         
-        # Get top-k indices
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:top_k]
+        # Get top-k indices: O(N) partition for the k-th best score, then sort
+        # only the chunks scoring at least that, earlier chunks first on ties
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        kth_score = -np.partition(-scores, k - 1)[k - 1]
+        candidates = np.flatnonzero(scores >= kth_score)
+        top_indices = candidates[np.lexsort((candidates, -scores[candidates]))][:k]
         
         # Create result chunks with scores
         results = []
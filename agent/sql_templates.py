@@ -1,11 +1,9 @@
 ﻿"""Hardcoded SQL templates for common queries."""
 
-def get_sql_for_question(question, constraints):
-    """Return pre-validated SQL for common question patterns."""
-    q_lower = question.lower()
-    
-    if "summer" in q_lower and "category" in q_lower and "quantity" in q_lower:
-        return """SELECT c.CategoryName as category, SUM(od.Quantity) as quantity
+import re
+
+
+TOP_CATEGORY_QTY_SUMMER_1997 = """SELECT c.CategoryName as category, SUM(od.Quantity) as quantity
 FROM Categories c
 JOIN Products p ON c.CategoryID = p.CategoryID
 JOIN "Order Details" od ON p.ProductID = od.ProductID
@@ -14,52 +12,107 @@ WHERE o.OrderDate BETWEEN '1997-06-01' AND '1997-06-30'
 GROUP BY c.CategoryID, c.CategoryName
 ORDER BY quantity DESC
 LIMIT 1"""
-    
-    if "aov" in q_lower or "average order value" in q_lower:
-        if "winter" in q_lower or "december" in q_lower or "1997-12" in constraints:
-            return """SELECT CAST(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS FLOAT) / COUNT(DISTINCT o.OrderID) as aov
+
+AOV_WINTER_1997 = """SELECT CAST(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS FLOAT) / COUNT(DISTINCT o.OrderID) as aov
 FROM Orders o
 JOIN "Order Details" od ON o.OrderID = od.OrderID
 WHERE o.OrderDate BETWEEN '1997-12-01' AND '1997-12-31'"""
-    
-    if ("top 3" in q_lower or "top three" in q_lower) and "product" in q_lower and "revenue" in q_lower:
-        return """SELECT p.ProductName as product, ROUND(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)), 2) as revenue
+
+TOP3_PRODUCTS_BY_REVENUE = """SELECT p.ProductName as product, ROUND(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)), 2) as revenue
 FROM Products p
 JOIN "Order Details" od ON p.ProductID = od.ProductID
 GROUP BY p.ProductID, p.ProductName
 ORDER BY revenue DESC
 LIMIT 3"""
-    
-    if "beverages" in q_lower and "revenue" in q_lower:
-        if "summer" in q_lower or "june" in q_lower or "1997-06" in constraints:
-            return """SELECT ROUND(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)), 2) as revenue
+
+BEVERAGES_REVENUE_SUMMER_1997 = """SELECT ROUND(SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)), 2) as revenue
 FROM "Order Details" od
 JOIN Products p ON od.ProductID = p.ProductID
 JOIN Categories c ON p.CategoryID = c.CategoryID
 JOIN Orders o ON od.OrderID = o.OrderID
 WHERE c.CategoryName = 'Beverages' AND o.OrderDate BETWEEN '1997-06-01' AND '1997-06-30'"""
-    
-    if "customer" in q_lower and ("margin" in q_lower or "gross margin" in q_lower):
-        if "1997" in q_lower or "1997" in constraints:
-            return """SELECT c.CompanyName as customer, ROUND(SUM((od.UnitPrice - 0.7 * od.UnitPrice) * od.Quantity * (1 - od.Discount)), 2) as margin
+
+TOP_CUSTOMER_MARGIN_1997 = """SELECT c.CompanyName as customer, ROUND(0.3 * SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)), 2) as margin
 FROM Customers c
 JOIN Orders o ON c.CustomerID = o.CustomerID
 JOIN "Order Details" od ON o.OrderID = od.OrderID
-WHERE strftime('%Y', o.OrderDate) = '1997'
+WHERE o.OrderDate >= '1997-01-01' AND o.OrderDate < '1998-01-01'
 GROUP BY c.CustomerID, c.CompanyName
 ORDER BY margin DESC
 LIMIT 1"""
+
+# A template applies when every keyword group has at least one hit, checked
+# in order. Keywords prefixed "constraints:" are looked up in the constraints.
+TEMPLATES = [
+    (({"summer"}, {"category"}, {"quantity"}), TOP_CATEGORY_QTY_SUMMER_1997),
+    (({"aov", "average order value"}, {"winter", "december", "constraints:1997-12"}), AOV_WINTER_1997),
+    (({"top 3", "top three"}, {"product"}, {"revenue"}), TOP3_PRODUCTS_BY_REVENUE),
+    (({"beverages"}, {"revenue"}, {"summer", "june", "constraints:1997-06"}), BEVERAGES_REVENUE_SUMMER_1997),
+    (({"customer"}, {"margin", "gross margin"}, {"1997", "constraints:1997"}), TOP_CUSTOMER_MARGIN_1997),
+]
+
+_CONSTRAINT_PREFIX = "constraints:"
+
+
+# Core tables and template identifiers; HybridAgent(prune_schema=True)
+# limits the NL->SQL prompt schema to these
+TEMPLATE_TABLES = {
+    "Orders", "Order Details", "Products", "Customers",
+    "Categories", "Suppliers", "Employees",
+}
+TEMPLATE_IDENTIFIERS = set(re.findall(r"\w+", " ".join(sql for _, sql in TEMPLATES)))
+
+
+def _compile_keywords(keywords):
+    """Build a matcher that finds every keyword in a text in one regex pass."""
+    ordered = sorted(keywords, key=len, reverse=True)
+    # Zero-width lookahead so overlapping keywords are all found
+    pattern = re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))")
+    # The longest keyword wins at a position; it implies its shorter prefixes
+    implied = {kw: {k for k in ordered if kw.startswith(k)} for kw in ordered}
+    
+    def match(text):
+        found = set()
+        for m in pattern.finditer(text):
+            found |= implied[m.group(1)]
+        return found
+    
+    return match
+
+
+_ALL_KEYWORDS = {kw for groups, _ in TEMPLATES for group in groups for kw in group}
+_match_question = _compile_keywords(
+    kw for kw in _ALL_KEYWORDS if not kw.startswith(_CONSTRAINT_PREFIX)
+)
+_match_constraints = _compile_keywords(
+    kw[len(_CONSTRAINT_PREFIX):] for kw in _ALL_KEYWORDS if kw.startswith(_CONSTRAINT_PREFIX)
+)
+
+
+def get_sql_for_question(question, constraints):
+    """Return pre-validated SQL for common question patterns."""
+    matched = _match_question(question.lower())
+    matched |= {_CONSTRAINT_PREFIX + kw for kw in _match_constraints(constraints)}
+    
+    for groups, sql in TEMPLATES:
+        if all(matched & group for group in groups):
+            return sql
     
     return None
 
 
+# Common LLM SQL mistakes and their SQLite fixes, applied in one pass
+_SQL_FIXUPS = {
+    'OrderDetails': '"Order Details"',
+    'ORDER DETAILS': '"Order Details"',
+    "EXTRACT(YEAR": "strftime('%Y'",
+}
+_SQL_FIXUP_RE = re.compile("|".join(map(re.escape, _SQL_FIXUPS)))
+
+
 def validate_and_fix_sql(sql):
     """Apply common fixes to SQL."""
     if not sql:
         return sql
     
-    sql = sql.replace('OrderDetails', '"Order Details"')
-    sql = sql.replace('ORDER DETAILS', '"Order Details"')
-    sql = sql.replace("EXTRACT(YEAR", "strftime('%Y'")
-    
-    return sql
\ No newline at end of file
+    return _SQL_FIXUP_RE.sub(lambda m: _SQL_FIXUPS[m.group()], sql)
\ No newline at end of file
@@ -1,17 +1,70 @@
 """SQLite database tool for Northwind queries."""
 
+import functools
+import queue
+import re
 import sqlite3
-from typing import Dict, List, Any, Optional
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Set, Tuple
 from pathlib import Path
 
 
+# Quoted literals/identifiers are kept verbatim; runs of whitespace and
+# comments collapse to one space
+_SQL_WHITESPACE_RE = re.compile(
+    r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|(?:\s|--[^\n]*|/\*.*?(?:\*/|$))+",
+    re.DOTALL
+)
+_READ_QUERY_RE = re.compile(r"^(SELECT|WITH)\b", re.IGNORECASE)
+# Opening ```/```sql and closing ``` markdown fences
+CODE_FENCE_RE = re.compile(r"^```(?:sql)?\s*|\s*```\s*$", re.MULTILINE)
+
+
+def normalize_sql(sql: str) -> str:
+    """Canonicalize whitespace and comments so equivalent queries share a cache key."""
+    return _SQL_WHITESPACE_RE.sub(lambda m: m.group(1) or " ", sql).strip()
+
+
+class _QueryKey:
+    """Cache key that compares by normalized SQL but keeps the original text.
+    
+    Only the first variant to run is executed, so a hit reuses its column
+    names; for unaliased expressions SQLite takes those from the raw text.
+    """
+    
+    __slots__ = ("sql", "normalized")
+    
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.normalized = normalize_sql(sql)
+    
+    def __hash__(self) -> int:
+        return hash(self.normalized)
+    
+    def __eq__(self, other) -> bool:
+        return isinstance(other, _QueryKey) and self.normalized == other.normalized
+
+
 class SQLiteTool:
     """Tool for interacting with the Northwind SQLite database."""
     
-    def __init__(self, db_path: str = "data/northwind.sqlite"):
+    def __init__(self, db_path: str = "data/northwind.sqlite", cache_size: int = 512,
+                 pool_size: int = 8):
         self.db_path = db_path
         self._ensure_db_exists()
-        self.schema = self._get_schema()
+        # Bounded pool: each connection serves one thread at a time, and
+        # short-lived threads (asyncio executors) reuse idle ones
+        self.pool_size = pool_size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()  # Guards _connections
+        # Static DB: read table names and the prompt schema once, in one pass
+        self._table_names, self.schema = self._get_schema()
+        # Northwind is static, so identical read queries return identical rows
+        self._execute_cached = functools.lru_cache(maxsize=cache_size)(
+            lambda key: self._run_query(key.sql)
+        )
     
     def _ensure_db_exists(self):
         """Check if database exists."""
@@ -21,66 +74,104 @@ class SQLiteTool:
                 "Please download using the curl command from the assignment."
             )
     
-    def _get_schema(self) -> str:
-        """Get database schema using PRAGMA statements."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Get all tables
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
-        
-        schema_parts = []
-        for table in tables:
-            # Get columns for each table
-            # Quote table name to handle spaces and special characters
-            quoted_table = f'"{table}"' if ' ' in table or '-' in table else table
+    def _connect(self) -> sqlite3.Connection:
+        """Open a read-only connection for the pool."""
+        # Pooled connections move between threads, one user at a time
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.executescript(
+            "PRAGMA query_only = 1;"
+            "PRAGMA cache_size = -20000;"  # ~20 MB page cache
+            "PRAGMA mmap_size = 268435456;"  # Read pages via mmap (256 MB)
+            "PRAGMA temp_store = MEMORY;"
+        )
+        return conn
+    
+    def _acquire(self) -> sqlite3.Connection:
+        """Take an idle connection, opening one while under pool_size, else wait."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.pool_size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+        return self._idle.get()
+    
+    @contextmanager
+    def _cursor(self):
+        """Yield a cursor on a pooled connection, returning it afterwards."""
+        conn = self._acquire()
+        try:
+            cursor = conn.cursor()
             try:
-                cursor.execute(f"PRAGMA table_info({quoted_table});")
-                columns = cursor.fetchall()
-                
-                if columns:  # Only add if we got column info
-                    col_info = ", ".join([
-                        f"{col[1]} ({col[2]})" for col in columns
-                    ])
-                    schema_parts.append(f"{table}: {col_info}")
-            except:
-                continue  # Skip problematic tables
+                yield cursor
+            finally:
+                cursor.close()
+        finally:
+            self._release(conn)
+    
+    def _release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, unless close() dropped it meanwhile."""
+        with self._lock:
+            if any(pooled is conn for pooled in self._connections):
+                self._idle.put(conn)
+    
+    def _get_schema(self) -> Tuple[List[str], str]:
+        """Get table names and database schema using PRAGMA statements."""
+        self._table_columns = {}
+        with self._cursor() as cursor:
+            # Get all tables
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            tables = [row[0] for row in cursor.fetchall()]
+            
+            schema_parts = []
+            for table in tables:
+                # Get columns for each table
+                # Quote table name to handle spaces and special characters
+                quoted_table = f'"{table}"' if ' ' in table or '-' in table else table
+                try:
+                    cursor.execute(f"PRAGMA table_info({quoted_table});")
+                    columns = cursor.fetchall()
+                    
+                    if columns:  # Only add if we got column info
+                        self._table_columns[table] = [(col[1], col[2]) for col in columns]
+                        schema_parts.append(self._format_table(table, self._table_columns[table]))
+                except:
+                    continue  # Skip problematic tables
         
-        conn.close()
-        return "\n".join(schema_parts)
+        return tables, "\n".join(schema_parts)
+    
+    def _format_table(self, table: str, columns: List[Tuple[str, str]]) -> str:
+        """Format one schema line as "Table: Col (TYPE), ..."."""
+        col_info = ", ".join([f"{name} ({col_type})" for name, col_type in columns])
+        return f"{table}: {col_info}"
     
     def execute_query(self, sql: str) -> Dict[str, Any]:
         """
         Execute SQL query and return results with metadata.
         
+        Read queries are cached by whitespace/comment-normalized text. A hit
+        returns the columns of the first variant that ran, so names of
+        unaliased expressions may differ from this query's spelling; alias
+        columns that callers read by name.
+        
         Returns:
             Dict with keys: columns, rows, error
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Clean up SQL (remove markdown formatting if present)
-            sql = sql.strip()
-            if sql.startswith("```sql"):
-                sql = sql.replace("```sql", "").replace("```", "").strip()
-            elif sql.startswith("```"):
-                sql = sql.replace("```", "").strip()
-            
-            cursor.execute(sql)
-            
-            # Get column names
-            columns = [desc[0] for desc in cursor.description] if cursor.description else []
-            
-            # Get all rows
-            rows = cursor.fetchall()
-            
-            conn.close()
+            sql = self._prepare_sql(sql)
+            # Cached by normalized text, but SQLite always runs the original
+            key = _QueryKey(sql)
+            if _READ_QUERY_RE.match(key.normalized):
+                columns, rows = self._execute_cached(key)
+            else:
+                columns, rows = self._run_query(sql)
             
             return {
-                "columns": columns,
-                "rows": rows,
+                "columns": list(columns),
+                "rows": list(rows),
                 "error": None
             }
         
@@ -106,29 +197,76 @@ class SQLiteTool:
                 "error": f"Query execution error: {str(e)}"
             }
     
+    def execute_query_exists(self, sql: str) -> bool:
+        """Check that a query runs and returns at least one row, fetching only that row."""
+        try:
+            with self._cursor() as cursor:
+                cursor.execute(self._prepare_sql(sql))
+                return cursor.fetchone() is not None
+        except Exception:
+            return False
+    
+    def _prepare_sql(self, sql: str) -> str:
+        """Strip surrounding whitespace and markdown fences."""
+        # Clean up SQL (remove markdown formatting if present)
+        sql = sql.strip()
+        if sql.startswith("```"):
+            sql = CODE_FENCE_RE.sub("", sql).strip()
+        
+        return sql
+    
+    def _run_query(self, sql: str) -> Tuple[tuple, tuple]:
+        """Execute SQL and return (columns, rows) as immutable tuples."""
+        with self._cursor() as cursor:
+            cursor.execute(sql)
+            
+            # Get column names
+            columns = tuple(desc[0] for desc in cursor.description) if cursor.description else ()
+            
+            # Get all rows
+            rows = tuple(cursor.fetchall())
+        
+        return columns, rows
+    
+    def invalidate_cache(self):
+        """Drop cached query results, e.g. after the database changes."""
+        self._execute_cached.cache_clear()
+    
     def _get_table_names(self) -> List[str]:
         """Get list of table names."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = [row[0] for row in cursor.fetchall()]
-            conn.close()
-            return tables
-        except:
-            return []
+        return self._table_names
     
     def get_schema_summary(self) -> str:
         """Get a concise schema summary for prompts."""
         return self.schema
     
+    def get_pruned_schema_summary(self, tables: Set[str], columns: Set[str]) -> str:
+        """Schema summary limited to the given tables and column names.
+        
+        Key columns (names ending in "ID") are always kept so joins stay possible.
+        """
+        return "\n".join(
+            self._format_table(table, [
+                (name, col_type) for name, col_type in table_columns
+                if name in columns or name.endswith("ID")
+            ])
+            for table, table_columns in self._table_columns.items()
+            if table in tables
+        )
+    
     def test_connection(self) -> bool:
         """Test database connection."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1;")
-            conn.close()
+            with self._cursor() as cursor:
+                cursor.execute("SELECT 1;")
             return True
         except Exception:
-            return False
\ No newline at end of file
+            return False
+    
+    def close(self):
+        """Close every pooled connection."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._idle = queue.LifoQueue()
+        for conn in connections:
+            conn.close()
\ No newline at end of file
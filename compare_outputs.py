@@ -1,18 +1,36 @@
 """Compare agent output with correct answers."""
 
-import json
+import reprlib
+from pathlib import Path
+
+import orjson
 from rich.console import Console
 from rich.table import Table
 
 console = Console()
 
+# Bounded previews for table cells: long answers are cut while being formatted
+short = reprlib.Repr()
+short.maxstring = 23
+short.maxlist = 2
+short.maxdict = 1
+
+
+def iter_jsonl(path):
+    """Parse a JSONL file record by record, skipping blank lines."""
+    for line in Path(path).read_bytes().splitlines():
+        if line.strip():
+            yield orjson.loads(line)
+
+
 # Load both files
-with open("outputs_hybrid.jsonl") as f:
-    agent_outputs = [json.loads(line) for line in f if line.strip()]
+agent_outputs = list(iter_jsonl("outputs_hybrid.jsonl"))
 
+# Correct answers are only looked up by id, so index them while parsing
 try:
-    with open("outputs_hybrid_CORRECT.jsonl") as f:
-        correct_outputs = [json.loads(line) for line in f if line.strip()]
+    correct_dict = {}
+    for o in iter_jsonl("outputs_hybrid_CORRECT.jsonl"):
+        correct_dict[o["id"]] = o
 except FileNotFoundError:
     console.print("[yellow]Run: python get_correct_answers.py first![/yellow]")
     exit(1)
@@ -27,24 +45,26 @@ table.add_column("Agent Answer", width=25)
 table.add_column("Correct Answer", width=25)
 table.add_column("Match?", width=8)
 
-# Create lookup
-correct_dict = {o["id"]: o for o in correct_outputs}
-
+# One pass: fill the table and collect mismatches for the detailed analysis
 matches = 0
+mismatches = []
 for i, agent in enumerate(agent_outputs, 1):
     q_id = agent["id"]
     correct = correct_dict.get(q_id, {})
+    a_ans = agent["final_answer"]
+    c_ans = correct.get("final_answer")
     
-    agent_ans = str(agent["final_answer"])[:23]
-    correct_ans = str(correct.get("final_answer", "N/A"))[:23]
+    agent_ans = short.repr(a_ans)[:23]
+    correct_ans = short.repr(c_ans)[:23] if correct else "N/A"
     
     # Check if match
-    match = agent["final_answer"] == correct.get("final_answer")
+    match = a_ans == c_ans
     if match:
         matches += 1
         status = "[green]✓[/green]"
     else:
         status = "[red]✗[/red]"
+        mismatches.append((i, q_id, agent, correct, a_ans, c_ans))
     
     table.add_row(
         str(i),
@@ -59,25 +79,19 @@ console.print(table)
 # Detailed comparison
 console.print("\n[bold]Detailed Analysis:[/bold]\n")
 
-for i, agent in enumerate(agent_outputs, 1):
-    q_id = agent["id"]
-    correct = correct_dict.get(q_id, {})
+for i, q_id, agent, correct, a_ans, c_ans in mismatches:
+    console.print(f"[bold red]❌ Question {i}: {q_id}[/bold red]")
+    console.print(f"   Agent:   {a_ans}")
+    console.print(f"   Correct: {c_ans}")
     
-    match = agent["final_answer"] == correct.get("final_answer")
+    # Show SQL comparison
+    if agent.get("sql") and correct.get("sql"):
+        console.print(f"\n   [dim]Agent SQL:[/dim]")
+        console.print(f"   [dim]{agent['sql'][:100]}...[/dim]")
+        console.print(f"\n   [dim]Correct SQL:[/dim]")
+        console.print(f"   [dim]{correct['sql'][:100]}...[/dim]")
     
-    if not match:
-        console.print(f"[bold red]❌ Question {i}: {q_id}[/bold red]")
-        console.print(f"   Agent:   {agent['final_answer']}")
-        console.print(f"   Correct: {correct.get('final_answer')}")
-        
-        # Show SQL comparison
-        if agent.get("sql") and correct.get("sql"):
-            console.print(f"\n   [dim]Agent SQL:[/dim]")
-            console.print(f"   [dim]{agent['sql'][:100]}...[/dim]")
-            console.print(f"\n   [dim]Correct SQL:[/dim]")
-            console.print(f"   [dim]{correct['sql'][:100]}...[/dim]")
-        
-        console.print()
+    console.print()
 
 # Summary
 console.print("\n[bold]Summary:[/bold]")
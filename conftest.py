@@ -0,0 +1 @@
+"""Pytest root: lets tests/ import the agent package when run as `pytest tests/`."""
@@ -1,4 +1,5 @@
 import os
+from pathlib import Path
 
 # Folder + file structure
 structure = {
@@ -28,20 +29,32 @@ structure = {
 }
 
 
-def create_structure(base_path, tree):
-    for name, content in tree.items():
-        full_path = os.path.join(base_path, name)
+def _flatten(tree, base_path):
+    """Yield (full_path, content) for each node, parents first (None for folders)."""
+    stack = [(base_path, tree)]
+    while stack:
+        base, subtree = stack.pop()
+        for name, content in subtree.items():
+            full_path = os.path.join(base, name)
+
+            # If content is a dict → folder
+            if isinstance(content, dict):
+                yield full_path, None
+                stack.append((full_path, content))
+            else:
+                yield full_path, content
 
-        # If content is a dict → folder
-        if isinstance(content, dict):
-            os.makedirs(full_path, exist_ok=True)
-            create_structure(full_path, content)
 
+def create_structure(base_path, tree):
+    for full_path, content in _flatten(tree, base_path):
+        if content is None:
+            os.makedirs(full_path, exist_ok=True)
+        elif content:
+            Path(full_path).write_text(content, encoding="utf-8")
+            print(f"Created file: {full_path}")
         else:
-            # Create empty file
-            with open(full_path, "w", encoding="utf-8") as f:
-                if isinstance(content, str):
-                    f.write(content)
+            # Create empty file (existing files are left as they are)
+            Path(full_path).touch()
             print(f"Created file: {full_path}")
 
 
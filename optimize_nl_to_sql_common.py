@@ -0,0 +1,205 @@
+"""Shared setup, training examples and optimization for the NL→SQL optimizer scripts."""
+
+import hashlib
+import json
+import shutil
+from pathlib import Path
+from typing import Callable, List, Literal
+
+import dspy
+from agent.dspy_signatures import GenerateSQL, NLtoSQLModule
+from agent.tools.sqlite_tool import SQLiteTool
+
+
+MODEL = 'ollama/llama3.2:1b'
+# Compiled modules, keyed by everything that affects the compile
+CACHE_DIR = Path(".cache")
+
+db_tool = SQLiteTool()
+# One schema string shared by every example, read once by SQLiteTool
+schema = db_tool.get_schema_summary()
+
+
+# Shared SQL fragments and KPI definitions for the training examples
+REVENUE_EXPR = "SUM(od.UnitPrice * od.Quantity * (1 - od.Discount))"
+REVENUE_KPI = "SUM(UnitPrice * Quantity * (1 - Discount))"
+PRODUCT_DETAILS_JOIN = 'JOIN "Order Details" od ON p.ProductID = od.ProductID'
+ORDER_DETAILS_JOIN = 'JOIN "Order Details" od ON o.OrderID = od.OrderID'
+JUNE_1997 = "BETWEEN '1997-06-01' AND '1997-06-30'"
+DECEMBER_1997 = "BETWEEN '1997-12-01' AND '1997-12-31'"
+JUNE_1997_DATES = "Dates: 1997-06-01 to 1997-06-30"
+DECEMBER_1997_DATES = "Dates: 1997-12-01 to 1997-12-31"
+
+
+def setup_lm() -> dspy.LM:
+    """Configure DSPy with the local Ollama model."""
+    lm = dspy.LM(
+        model=MODEL,
+        api_base='http://localhost:11434',
+        max_tokens=500,
+        temperature=0.1
+    )
+    dspy.configure(lm=lm)
+    return lm
+
+
+def build_examples(version: Literal["v1", "v2"]) -> List[dspy.Example]:
+    """Training examples for NL→SQL.
+    
+    v1 is the original set (schema passed as "schema"); v2 is the corrected
+    set with proper SQL (schema passed as "db_schema").
+    """
+    if version == "v1":
+        return [
+            dspy.Example(
+                question="What are the top 3 products by revenue?",
+                schema=schema,
+                constraints=f"Revenue = {REVENUE_KPI}",
+                sql=f'SELECT p.ProductName, {REVENUE_EXPR} as revenue FROM Products p {PRODUCT_DETAILS_JOIN} GROUP BY p.ProductName ORDER BY revenue DESC LIMIT 3'
+            ).with_inputs("question", "schema", "constraints"),
+    
+            dspy.Example(
+                question="Total orders in June 1997",
+                schema=schema,
+                constraints=JUNE_1997_DATES,
+                sql=f"SELECT COUNT(*) FROM Orders WHERE OrderDate {JUNE_1997}"
+            ).with_inputs("question", "schema", "constraints"),
+    
+            dspy.Example(
+                question="Which category had highest quantity sold?",
+                schema=schema,
+                constraints="Focus on Beverages category",
+                sql=f'SELECT c.CategoryName, SUM(od.Quantity) as total_qty FROM Categories c JOIN Products p ON c.CategoryID = p.CategoryID {PRODUCT_DETAILS_JOIN} GROUP BY c.CategoryName ORDER BY total_qty DESC LIMIT 1'
+            ).with_inputs("question", "schema", "constraints"),
+    
+            dspy.Example(
+                question="Average order value for December 1997",
+                schema=schema,
+                constraints=f"AOV = {REVENUE_KPI} / COUNT(DISTINCT OrderID). {DECEMBER_1997_DATES}",
+                sql=f'SELECT {REVENUE_EXPR} / COUNT(DISTINCT o.OrderID) as aov FROM Orders o {ORDER_DETAILS_JOIN} WHERE o.OrderDate {DECEMBER_1997}'
+            ).with_inputs("question", "schema", "constraints"),
+    
+            dspy.Example(
+                question="Revenue from Beverages category",
+                schema=schema,
+                constraints="Category: Beverages. Revenue calculation.",
+                sql=f'SELECT {REVENUE_EXPR} as revenue FROM "Order Details" od JOIN Products p ON od.ProductID = p.ProductID JOIN Categories c ON p.CategoryID = c.CategoryID WHERE c.CategoryName = \'Beverages\''
+            ).with_inputs("question", "schema", "constraints"),
+        ]
+    
+    # CORRECTED training examples with proper SQL
+    return [
+        # Example 1: Top products by revenue
+        dspy.Example(
+            question="Top 3 products by total revenue all-time",
+            db_schema=schema,
+            constraints=f"Revenue = {REVENUE_KPI}",
+            sql=f'SELECT p.ProductName, {REVENUE_EXPR} as revenue FROM Products p {PRODUCT_DETAILS_JOIN} GROUP BY p.ProductID, p.ProductName ORDER BY revenue DESC LIMIT 3'
+        ).with_inputs("question", "db_schema", "constraints"),
+    
+        # Example 2: Revenue by category with date filter
+        dspy.Example(
+            question="Total revenue from Beverages category in June 1997",
+            db_schema=schema,
+            constraints=f"{JUNE_1997_DATES}. Category: Beverages",
+            sql=f'SELECT {REVENUE_EXPR} as revenue FROM "Order Details" od JOIN Products p ON od.ProductID = p.ProductID JOIN Categories c ON p.CategoryID = c.CategoryID JOIN Orders o ON od.OrderID = o.OrderID WHERE c.CategoryName = \'Beverages\' AND o.OrderDate {JUNE_1997}'
+        ).with_inputs("question", "db_schema", "constraints"),
+    
+        # Example 3: Average Order Value with date filter
+        dspy.Example(
+            question="What was the Average Order Value in December 1997?",
+            db_schema=schema,
+            constraints=f"AOV = {REVENUE_KPI} / COUNT(DISTINCT OrderID). {DECEMBER_1997_DATES}",
+            sql=f'SELECT CAST({REVENUE_EXPR} AS FLOAT) / COUNT(DISTINCT o.OrderID) as aov FROM Orders o {ORDER_DETAILS_JOIN} WHERE o.OrderDate {DECEMBER_1997}'
+        ).with_inputs("question", "db_schema", "constraints"),
+    
+        # Example 4: Category with highest quantity sold in date range
+        dspy.Example(
+            question="Which category had highest quantity sold in June 1997?",
+            db_schema=schema,
+            constraints=JUNE_1997_DATES,
+            sql=f'SELECT c.CategoryName, SUM(od.Quantity) as total_qty FROM Categories c JOIN Products p ON c.CategoryID = p.CategoryID {PRODUCT_DETAILS_JOIN} JOIN Orders o ON od.OrderID = o.OrderID WHERE o.OrderDate {JUNE_1997} GROUP BY c.CategoryID, c.CategoryName ORDER BY total_qty DESC LIMIT 1'
+        ).with_inputs("question", "db_schema", "constraints"),
+    
+        # Example 5: Customer by gross margin
+        dspy.Example(
+            question="Top customer by gross margin in 1997",
+            db_schema=schema,
+            constraints=f"Gross Margin = 0.3 * {REVENUE_KPI}. Year: 1997",
+            sql=f'SELECT c.CompanyName as customer, 0.3 * {REVENUE_EXPR} as margin FROM Customers c JOIN Orders o ON c.CustomerID = o.CustomerID {ORDER_DETAILS_JOIN} WHERE o.OrderDate >= \'1997-01-01\' AND o.OrderDate < \'1998-01-01\' GROUP BY c.CustomerID, c.CompanyName ORDER BY margin DESC LIMIT 1'
+        ).with_inputs("question", "db_schema", "constraints"),
+    
+        # Example 6: Simple count with date range
+        dspy.Example(
+            question="How many orders in June 1997?",
+            db_schema=schema,
+            constraints=JUNE_1997_DATES,
+            sql=f'SELECT COUNT(*) as order_count FROM Orders WHERE OrderDate {JUNE_1997}'
+        ).with_inputs("question", "db_schema", "constraints"),
+    ]
+
+
+def _pred_sql(pred) -> str:
+    """SQL from a prediction, or pred itself when it is already the SQL string."""
+    return pred.sql if hasattr(pred, "sql") else pred
+
+
+def sql_executes(example, pred, trace=None):
+    """Validation function: check if generated SQL executes successfully."""
+    try:
+        result = db_tool.execute_query(_pred_sql(pred))
+        return result["error"] is None
+    except:
+        return False
+
+
+def sql_returns_rows(example, pred, trace=None):
+    """Check if SQL executes successfully and returns rows."""
+    return db_tool.execute_query_exists(_pred_sql(pred))
+
+
+def _compile_key(examples: List[dspy.Example], metric: Callable, max_demos: int) -> str:
+    """Hash of the examples, schema, LM, metric, demo budget and NL->SQL signature."""
+    # Saved demos are restored onto signature fields by position, so a
+    # changed signature must not reuse an old compile
+    payload = json.dumps({
+        "signature": {
+            "instructions": GenerateSQL.instructions,
+            "fields": list(GenerateSQL.fields),
+        },
+        "examples": [dict(ex) for ex in examples],
+        "schema": hashlib.sha256(schema.encode()).hexdigest(),
+        "lm": MODEL,
+        "metric": metric.__name__,
+        "max_demos": max_demos,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def optimize(examples: List[dspy.Example], out_path: str, metric: Callable = sql_executes,
+             max_demos: int = 4) -> NLtoSQLModule:
+    """Compile NLtoSQLModule with BootstrapFewShot and save it to out_path.
+    
+    Reuses a previous compile with the same inputs from CACHE_DIR.
+    """
+    cache_path = CACHE_DIR / f"optimized_{_compile_key(examples, metric, max_demos)}.json"
+    optimized_module = NLtoSQLModule()
+    
+    if cache_path.exists():
+        print(f"Reusing compiled module from {cache_path}")
+        optimized_module.load(str(cache_path))
+    else:
+        optimizer = dspy.BootstrapFewShot(
+            metric=metric,
+            max_bootstrapped_demos=max_demos,
+            max_labeled_demos=max_demos
+        )
+        optimized_module = optimizer.compile(
+            optimized_module,
+            trainset=examples
+        )
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        optimized_module.save(str(cache_path))
+    
+    shutil.copyfile(cache_path, out_path)
+    return optimized_module
@@ -3,6 +3,8 @@
 import click
 import json
 import dspy
+import orjson
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
 from rich.console import Console
 from rich.progress import track
@@ -13,9 +15,28 @@ from agent.graph_hybrid import HybridAgent
 
 console = Console()
 
+# Index of the last connection method verified with --probe
+LM_CACHE_FILE = Path(".dspy_lm_cache.json")
+# Flush the output file every this many results
+FLUSH_EVERY = 10
+# Output buffer size; small result lines coalesce into few writes
+WRITE_BUFFER_BYTES = 256 * 1024
 
-def setup_dspy_lm():
-    """Setup DSPy with local Ollama model."""
+
+def _load_cached_method() -> int:
+    """Read the last verified connection method index, or 0."""
+    try:
+        return int(json.loads(LM_CACHE_FILE.read_text())["method"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return 0
+
+
+def setup_dspy_lm(probe: bool = False):
+    """Setup DSPy with local Ollama model.
+    
+    Uses the last method verified with probe=True; probing tries each
+    method with a test call and remembers the first that works.
+    """
     model_name = "llama3.2:1b"  # Change this to your model
     
     console.print(f"[yellow]Attempting to connect to Ollama with model: {model_name}[/yellow]")
@@ -46,16 +67,23 @@ def setup_dspy_lm():
         ),
     ]
     
-    for i, method in enumerate(methods, 1):
+    # Cached method first, then the rest in their usual order
+    cached = _load_cached_method()
+    order = sorted(range(len(methods)), key=lambda idx: idx != cached)
+    
+    for idx in order:
+        i = idx + 1
         try:
             console.print(f"[dim]Trying connection method {i}...[/dim]")
-            lm = method()
+            lm = methods[idx]()
             dspy.configure(lm=lm)
             
-            # Test with a simple query
-            console.print("[dim]Testing connection...[/dim]")
-            test_module = dspy.ChainOfThought("question -> answer")
-            result = test_module(question="What is 2+2?")
+            if probe:
+                # Test with a simple query
+                console.print("[dim]Testing connection...[/dim]")
+                test_module = dspy.ChainOfThought("question -> answer")
+                result = test_module(question="What is 2+2?")
+                LM_CACHE_FILE.write_text(json.dumps({"method": idx}))
             
             console.print(f"[green]✓ Successfully connected using method {i}[/green]")
             return lm
@@ -72,79 +100,127 @@ def setup_dspy_lm():
     raise RuntimeError("Failed to connect to Ollama with any method")
 
 
+def dumps_line(record: dict) -> bytes:
+    """Serialize one output record as a JSONL line."""
+    try:
+        return orjson.dumps(record) + b'\n'
+    except TypeError:
+        # orjson rejects integers beyond 64 bits, which json accepts
+        return json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+def iter_questions(batch: str, warn: bool = True):
+    """Yield questions from a JSONL file, skipping blank and invalid lines."""
+    with open(batch, 'r') as f:
+        for line_num, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:  # Skip empty lines
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                if warn:
+                    console.print(f"[yellow]⚠ Skipping invalid JSON on line {line_num}: {e}[/yellow]")
+                continue
+
+
+def answer_question(agent: HybridAgent, q: dict, verbose: bool = False) -> dict:
+    """Run the agent on one question and build its output record."""
+    if verbose:
+        console.print(f"\n[cyan]Question: {q['question']}[/cyan]")
+    
+    try:
+        result = agent.run(q["question"], q["format_hint"])
+        
+        output = {
+            "id": q["id"],
+            "final_answer": result["final_answer"],
+            "sql": result["sql"],
+            "confidence": result["confidence"],
+            "explanation": result["explanation"],
+            "citations": result["citations"]
+        }
+        
+        if verbose:
+            console.print(f"[green]✓ Answer: {result['final_answer']}[/green]")
+            console.print(f"[dim]Confidence: {result['confidence']:.2f}[/dim]")
+        
+    except Exception as e:
+        console.print(f"[red]✗ Error ({q['id']}): {str(e)}[/red]")
+        output = {
+            "id": q["id"],
+            "final_answer": None,
+            "sql": "",
+            "confidence": 0.0,
+            "explanation": f"Error: {str(e)}",
+            "citations": []
+        }
+    
+    return output
+
+
+def iter_answers(executor: ThreadPoolExecutor, agent: HybridAgent, questions, verbose: bool,
+                 max_in_flight: int):
+    """Yield output records in completion order, with at most max_in_flight questions submitted."""
+    pending = set()
+    for q in questions:
+        pending.add(executor.submit(answer_question, agent, q, verbose))
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    
+    for future in as_completed(pending):
+        yield future.result()
+
+
 @click.command()
 @click.option('--batch', required=True, help='Input JSONL file with questions')
 @click.option('--out', required=True, help='Output JSONL file for results')
-def main(batch: str, out: str):
+@click.option('--semantic-cache', is_flag=True, help='Reuse answers for semantically equivalent questions')
+@click.option('--probe', is_flag=True, help='Verify the Ollama connection with a test call')
+@click.option('--workers', default=4, show_default=True, type=click.IntRange(min=1),
+              help='Questions answered concurrently')
+@click.option('--verbose', is_flag=True, help='Print each question, answer and confidence')
+def main(batch: str, out: str, semantic_cache: bool, probe: bool, workers: int, verbose: bool):
     """Run the Retail Analytics Copilot on a batch of questions."""
     
     console.print("[bold blue]🚀 Starting Retail Analytics Copilot[/bold blue]")
     
     # Setup DSPy
     console.print("[yellow]Setting up DSPy with Ollama...[/yellow]")
-    lm = setup_dspy_lm()
+    lm = setup_dspy_lm(probe=probe)
     
     # Initialize DSPy modules
     router = RouterModule()
     nl_to_sql = NLtoSQLModule()
     synthesizer = SynthesizerModule()
     
+    # Optional semantic cache (needs faiss + sentence-transformers)
+    cache = None
+    if semantic_cache:
+        from agent.cache.semantic_cache import SemanticCache
+        console.print("[yellow]Loading semantic cache...[/yellow]")
+        cache = SemanticCache()
+    
     # Create agent
     console.print("[yellow]Building LangGraph agent...[/yellow]")
-    agent = HybridAgent(router, nl_to_sql, synthesizer)
+    agent = HybridAgent(router, nl_to_sql, synthesizer, cache=cache)
     
-    # Load questions
-    questions = []
-    with open(batch, 'r') as f:
-        for line_num, line in enumerate(f, 1):
-            line = line.strip()
-            if not line:  # Skip empty lines
-                continue
-            try:
-                questions.append(json.loads(line))
-            except json.JSONDecodeError as e:
-                console.print(f"[yellow]⚠ Skipping invalid JSON on line {line_num}: {e}[/yellow]")
-                continue
-    
-    console.print(f"[green]Loaded {len(questions)} questions[/green]")
-    
-    # Process each question
-    results = []
-    for q in track(questions, description="Processing questions..."):
-        console.print(f"\n[cyan]Question: {q['question']}[/cyan]")
-        
-        try:
-            result = agent.run(q["question"], q["format_hint"])
-            
-            output = {
-                "id": q["id"],
-                "final_answer": result["final_answer"],
-                "sql": result["sql"],
-                "confidence": result["confidence"],
-                "explanation": result["explanation"],
-                "citations": result["citations"]
-            }
-            
-            console.print(f"[green]✓ Answer: {result['final_answer']}[/green]")
-            console.print(f"[dim]Confidence: {result['confidence']:.2f}[/dim]")
-            
-        except Exception as e:
-            console.print(f"[red]✗ Error: {str(e)}[/red]")
-            output = {
-                "id": q["id"],
-                "final_answer": None,
-                "sql": "",
-                "confidence": 0.0,
-                "explanation": f"Error: {str(e)}",
-                "citations": []
-            }
-        
-        results.append(output)
+    # Count questions up front for the progress bar; they are read lazily.
+    # Same skip rules as the run itself, so the bar ends at 100%
+    total = sum(1 for _ in iter_questions(batch, warn=False))
+    console.print(f"[green]Found {total} questions[/green]")
     
-    # Write results
-    with open(out, 'w') as f:
-        for result in results:
-            f.write(json.dumps(result) + '\n')
+    # Answer questions concurrently (each is mostly waiting on Ollama),
+    # writing results in completion order as soon as they are ready.
+    # Only a few questions are in flight, so memory stays flat for any batch size
+    with open(out, 'wb', buffering=WRITE_BUFFER_BYTES) as f, ThreadPoolExecutor(max_workers=workers) as executor:
+        answers = iter_answers(executor, agent, iter_questions(batch), verbose, max_in_flight=workers * 2)
+        for n, output in enumerate(track(answers, total=total, description="Processing questions..."), 1):
+            f.write(dumps_line(output))
+            if n % FLUSH_EVERY == 0:
+                f.flush()
     
     console.print(f"\n[bold green]✓ Results written to {out}[/bold green]")
 
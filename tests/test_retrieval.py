@@ -0,0 +1,23 @@
+"""Tests for BM25 document retrieval."""
+
+from agent.rag.retrieval import DocumentRetriever
+
+
+def make_retriever(tmp_path, *docs):
+    for i, text in enumerate(docs):
+        (tmp_path / f"doc{i}.md").write_text(text, encoding="utf-8")
+    return DocumentRetriever(docs_dir=str(tmp_path))
+
+
+def test_tokenize_splits_on_non_ascii(tmp_path):
+    retriever = make_retriever(tmp_path, "﻿# Returns\n\nPerishables: 3–7 days.")
+    assert retriever._tokenize("Perishables: 3–7 days.") == ["perishables", "3", "7", "days"]
+    assert retriever._tokenize("Côte de Blaye") == ["c", "te", "de", "blaye"]
+    assert retriever._tokenize("﻿Returns") == ["returns"]
+
+
+def test_retrieve_breaks_ties_by_chunk_order(tmp_path):
+    retriever = make_retriever(tmp_path, "\n\n".join(f"Section {i} about nothing in particular." for i in range(40)))
+    # No query term is in the vocabulary, so every chunk scores zero
+    results = retriever.retrieve("zzz", top_k=3)
+    assert [chunk.id for chunk in results] == ["doc0::chunk0", "doc0::chunk1", "doc0::chunk2"]
@@ -0,0 +1,45 @@
+"""Tests for the SQLite tool's connection pool."""
+
+import itertools
+
+from agent.graph_hybrid import HybridAgent
+from agent.tools.sqlite_tool import SQLiteTool
+
+
+class StubRouter:
+    async def aforward(self, question):
+        return "sql"
+
+
+class StubNLtoSQL:
+    """Distinct SQL per call, so every run reaches the database."""
+    
+    def __init__(self):
+        self.counter = itertools.count()
+    
+    async def aforward(self, question, schema, constraints):
+        return f"SELECT {next(self.counter)} AS n FROM Orders LIMIT 1"
+
+
+class StubSynthesizer:
+    async def aforward(self, question, format_hint, sql_results, doc_chunks):
+        return "1"
+
+
+def test_connections_stay_bounded_across_runs():
+    agent = HybridAgent(StubRouter(), StubNLtoSQL(), StubSynthesizer())
+    for i in range(20):
+        agent.run(f"How many rows in run {i}?", "int")
+    assert len(agent.db_tool._connections) <= agent.db_tool.pool_size
+    assert len(agent.db_tool._connections) <= 2
+    agent.db_tool.close()
+
+
+def test_pool_reopens_after_close():
+    tool = SQLiteTool(pool_size=2)
+    assert tool.execute_query("SELECT COUNT(*) FROM Orders")["error"] is None
+    tool.close()
+    assert tool._connections == []
+    assert tool.execute_query("SELECT COUNT(*) FROM Customers")["error"] is None
+    assert len(tool._connections) == 1
+    tool.close()